@@ -1,11 +1,14 @@
+import collections
 import logging
+import socket
 from typing import Dict, Any, Optional
 import json
 import urllib.parse
-import threading
-import requests
 
 import attr
+from twisted.internet import defer
+from twisted.web.client import readBody
+from twisted.web.http_headers import Headers
 
 from synapse.module_api import ModuleApi
 from synapse.module_api.errors import ConfigError
@@ -14,7 +17,17 @@ from synapse.spam_checker_api import RegistrationBehaviour
 
 logger = logging.getLogger(__name__)
 
-@attr.s(auto_attribs=True, frozen=True)
+# Bound at module level to skip the attribute lookup on the hot path
+quote = urllib.parse.quote
+
+# Prefer orjson for the admin API bodies; fall back to compact stdlib json
+try:
+    from orjson import dumps as json_dumps
+except ImportError:
+    def json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+@attr.s(auto_attribs=True, frozen=True, slots=True)
 class RegistrationMonitorConfig:
     notification_room: str
     admin_token: str  # Required admin token for API access
@@ -24,8 +37,13 @@ class RegistrationMonitorConfig:
     server_name: Optional[str] = None
     reason: str = "Account suspended pending review"
     homeserver_url: str = "http://localhost:8008"  # Default to localhost
+    max_concurrent_admin_calls: int = 8  # Cap on in-flight admin API requests
 
 class RegistrationMonitor:
+    # Cap on remembered registration notifications awaiting their
+    # confirmation edit, in case user_created_callback never fires
+    _MAX_PENDING_NOTIFICATIONS = 128
+
     def __init__(self, config: JsonDict, api: ModuleApi):
         # Validate and process config
         if not config.get("notification_room"):
@@ -37,6 +55,59 @@ class RegistrationMonitor:
         self.config = RegistrationMonitorConfig(**config)
         self.api = api
 
+        # Catch a malformed homeserver_url at startup instead of on the
+        # first admin call
+        parsed = urllib.parse.urlsplit(self.config.homeserver_url)
+        if parsed.scheme not in ("http", "https"):
+            raise ConfigError(
+                f"homeserver_url must be an http(s) URL, got {self.config.homeserver_url!r}"
+            )
+
+        # Warm the resolver cache and surface unresolvable hosts early; a
+        # transient failure here shouldn't stop Synapse from starting
+        try:
+            socket.getaddrinfo(
+                parsed.hostname, parsed.port or (443 if parsed.scheme == "https" else 80)
+            )
+        except socket.gaierror as e:
+            logger.warning(
+                "Could not resolve homeserver_url host %r: %s", parsed.hostname, e
+            )
+
+        # Precompute values used on every registration. The flags and room id
+        # are also cached directly on self to skip the self.config.X hop in
+        # the hot callbacks.
+        self._suspend_users = self.config.suspend_users
+        self._force_join = self.config.force_join_room
+        self._notification_room = self.config.notification_room
+        self._sender = self.config.admin_user or f"@admin:{self.config.server_name or api.server_name}"
+        self._suspend_url_prefix = f"{self.config.homeserver_url}/_synapse/admin/v1/suspend/"
+        # The suspend body is constant, so serialize it once
+        self._suspend_body = json_dumps({"suspend": True})
+        # The notification room never changes, so encode it once rather than
+        # on every registration
+        self._join_url = f"{self.config.homeserver_url}/_synapse/admin/v1/join/{quote(self.config.notification_room)}"
+
+        # Registration notifications waiting to be edited with the outcome,
+        # keyed by user id; LRU-bounded so abandoned registrations don't
+        # leak. No lock needed: the reactor is single-threaded and neither
+        # critical section awaits.
+        self._pending_notifications: "collections.OrderedDict[str, tuple]" = collections.OrderedDict()
+
+        # Backpressure for admin API calls so a registration burst (e.g. an
+        # open-signup spam wave) can't flood the homeserver. Deferred-native
+        # so Twisted can drive the waiters; asyncio primitives can't be
+        # awaited on the plain reactor.
+        self._admin_sem = defer.DeferredSemaphore(self.config.max_concurrent_admin_calls)
+
+        # Ride Synapse's own reactor-driven HTTP client and connection pool
+        # for the admin calls instead of bringing up a second HTTP stack
+        self._http = api.http_client
+        self._admin_headers = Headers({
+            b"Authorization": [f"Bearer {self.config.admin_token}".encode("ascii")],
+            b"Content-Type": [b"application/json"],
+        })
+
         # Register our spam checker callback
         self.api.register_spam_checker_callbacks(
             check_registration_for_spam=self.check_registration_for_spam
@@ -79,21 +150,20 @@ class RegistrationMonitor:
                  f"- IP Address: {ip}\n" \
                  f"- Auth Method: {auth}"
 
-        if self.config.suspend_users:
+        if self._suspend_users:
             message += "\n✋ User will be automatically suspended after registration."
 
         # Send notification to the specified room
         try:
-            await self.api.create_and_send_event_into_room({
-                "room_id": self.config.notification_room,
-                "type": "m.room.message",
-                "sender": self.config.admin_user or f"@admin:{self.config.server_name or self.api.server_name}",
-                "content": {
-                    "msgtype": "m.text",
-                    "body": message
-                }
-            })
+            event = await self.api.create_and_send_event_into_room(self._make_event(message))
             logger.info("Sent registration notification for user %s", username)
+
+            # Remember the event so the confirmation can edit it instead of
+            # sending a second room event for the same registration
+            user_id = f"@{username}:{self.api.server_name}"
+            self._pending_notifications[user_id] = (event.event_id, message)
+            while len(self._pending_notifications) > self._MAX_PENDING_NOTIFICATIONS:
+                self._pending_notifications.popitem(last=False)
         except Exception as e:
             logger.error("Failed to send registration notification: %s", e)
 
@@ -102,154 +172,151 @@ class RegistrationMonitor:
 
     async def user_created_callback(self, user_id: str) -> None:
         """Called when a new user has been created."""
-        actions_performed = []
+        # Nothing to do if both post-registration actions are disabled
+        if not (self._suspend_users or self._force_join):
+            return
+
+        # Both admin calls are independent round-trips to the same
+        # homeserver, so run them concurrently instead of one after the other
+        coros = []
+        labels = []
 
         # Force join the user to the notification room if configured
-        if self.config.force_join_room:
-            success = await self._force_join_room(user_id, self.config.notification_room)
-            if success:
-                actions_performed.append("joined to notification room")
+        if self._force_join:
+            coros.append(self._force_join_room(user_id))
+            labels.append("joined to notification room")
 
         # Suspend the user if configured
-        if self.config.suspend_users:
-            success = await self._suspend_user(user_id)
-            if success:
-                actions_performed.append("suspended")
+        if self._suspend_users:
+            coros.append(self._suspend_user(user_id))
+            labels.append("suspended")
+
+        # Synapse drives module coroutines with Twisted's ensureDeferred on
+        # the plain reactor, so use Deferred-native concurrency rather than
+        # asyncio.gather (which needs a running asyncio loop)
+        results = await defer.DeferredList(
+            [defer.ensureDeferred(coro) for coro in coros], consumeErrors=True
+        )
+
+        actions_performed = []
+        for label, (success, result) in zip(labels, results):
+            if not success:
+                logger.error("Error while handling new user %s: %s", user_id, result.value)
+            elif result:
+                actions_performed.append(label)
+
+        # Drop the pending notification entry whatever the outcome, so
+        # registrations whose admin calls all failed don't linger until
+        # LRU eviction
+        pending = self._pending_notifications.pop(user_id, None)
 
         # Send confirmation message
         if actions_performed:
             actions_text = " and ".join(actions_performed)
             message = f"✅ User {user_id} has been {actions_text}."
 
+            # Edit the registration notification in place where possible so a
+            # single room event covers the whole registration
             try:
-                await self.api.create_and_send_event_into_room({
-                    "room_id": self.config.notification_room,
-                    "type": "m.room.message",
-                    "sender": self.config.admin_user or f"@admin:{self.config.server_name or self.api.server_name}",
-                    "content": {
-                        "msgtype": "m.text",
-                        "body": message
-                    }
-                })
+                if pending is not None:
+                    prior_event_id, prior_body = pending
+                    combined = f"{prior_body}\n{message}"
+                    await self.api.create_and_send_event_into_room(
+                        self._make_event(combined, replaces=prior_event_id)
+                    )
+                else:
+                    await self.api.create_and_send_event_into_room(self._make_event(message))
             except Exception as e:
                 logger.error("Failed to send confirmation message: %s", e)
 
-    def _suspend_user_thread(self, user_id: str, result_list):
+    def _make_event(self, body: str, replaces: Optional[str] = None) -> JsonDict:
         """
-        Synchronous function to suspend a user using the admin API.
-        This runs in a separate thread.
-        """
-        try:
-            # Encode the user_id for the URL
-            encoded_user_id = urllib.parse.quote(user_id)
-
-            # Use the suspension endpoint
-            suspend_url = f"{self.config.homeserver_url}/_synapse/admin/v1/suspend/{encoded_user_id}"
+        Build an m.room.message event for the notification room.
 
-            headers = {
-                "Authorization": f"Bearer {self.config.admin_token}",
-                "Content-Type": "application/json"
+        If `replaces` is given, the event is an m.replace edit of that
+        prior event rather than a fresh message.
+        """
+        content: JsonDict = {
+            "msgtype": "m.text",
+            "body": body
+        }
+        if replaces is not None:
+            content["body"] = f"* {body}"
+            content["m.new_content"] = {
+                "msgtype": "m.text",
+                "body": body
             }
-
-            suspend_data = {
-                "suspend": True
+            content["m.relates_to"] = {
+                "rel_type": "m.replace",
+                "event_id": replaces
             }
+        return {
+            "room_id": self._notification_room,
+            "type": "m.room.message",
+            "sender": self._sender,
+            "content": content
+        }
 
-            response = requests.put(
-                suspend_url,
-                headers=headers,
-                json=suspend_data,
-                timeout=30.0
-            )
+    async def _suspend_user(self, user_id: str) -> bool:
+        """
+        Suspend a user using the admin API.
+        """
+        try:
+            # Encode the user_id for the URL and use the suspension endpoint
+            suspend_url = self._suspend_url_prefix + quote(user_id)
+
+            await self._admin_sem.acquire()
+            try:
+                response = await self._http.request(
+                    "PUT", suspend_url, data=self._suspend_body, headers=self._admin_headers
+                )
+                # Always drain the body so the Agent returns the persistent
+                # connection to the keep-alive pool
+                body = await readBody(response)
+                if response.code == 200:
+                    logger.info("Successfully suspended user %s", user_id)
+                    return True
 
-            if response.status_code == 200:
-                logger.info("Successfully suspended user %s", user_id)
-                result_list.append(True)
-            else:
                 logger.error(
                     "Failed to suspend user %s: HTTP %d: %s",
-                    user_id, response.status_code, response.text
+                    user_id, response.code, body
                 )
-                result_list.append(False)
+                return False
+            finally:
+                self._admin_sem.release()
 
         except Exception as e:
             logger.error("Error suspending user %s: %s", user_id, e)
-            result_list.append(False)
+            return False
 
-    def _force_join_room_thread(self, user_id: str, room_id: str, result_list):
+    async def _force_join_room(self, user_id: str) -> bool:
         """
-        Synchronous function to force a user to join a room using the admin API.
-        This runs in a separate thread.
+        Force a user to join the notification room using the admin API.
         """
+        room_id = self._notification_room
         try:
-            # URL encode room_id since it contains special characters
-            encoded_room_id = urllib.parse.quote(room_id)
-            url = f"{self.config.homeserver_url}/_synapse/admin/v1/join/{encoded_room_id}"
-
-            headers = {
-                "Authorization": f"Bearer {self.config.admin_token}",
-                "Content-Type": "application/json"
-            }
-
-            data = {"user_id": user_id}
+            data = json_dumps({"user_id": user_id})
 
-            response = requests.post(
-                url,
-                headers=headers,
-                json=data,
-                timeout=30.0
-            )
+            await self._admin_sem.acquire()
+            try:
+                response = await self._http.request(
+                    "POST", self._join_url, data=data, headers=self._admin_headers
+                )
+                # Always drain the body so the Agent returns the persistent
+                # connection to the keep-alive pool
+                body = await readBody(response)
+                if response.code == 200:
+                    logger.info("Successfully joined user %s to room %s", user_id, room_id)
+                    return True
 
-            if response.status_code == 200:
-                logger.info("Successfully joined user %s to room %s", user_id, room_id)
-                result_list.append(True)
-            else:
                 logger.error(
                     "Failed to join user %s to room %s: HTTP %d: %s",
-                    user_id, room_id, response.status_code, response.text
+                    user_id, room_id, response.code, body
                 )
-                result_list.append(False)
+                return False
+            finally:
+                self._admin_sem.release()
 
         except Exception as e:
             logger.error("Error joining user %s to room %s: %s", user_id, room_id, e)
-            result_list.append(False)
-
-    async def _suspend_user(self, user_id: str) -> bool:
-        """
-        Async wrapper to run the synchronous suspension function in a thread.
-        """
-        result_list = []
-        thread = threading.Thread(
-            target=self._suspend_user_thread,
-            args=(user_id, result_list)
-        )
-        thread.start()
-
-        # Await in the event loop for the thread to complete
-        # We use the sleep function to yield control back to the event loop
-        # while periodically checking if the thread is done
-        while thread.is_alive():
-            await self.api.sleep(0.1)  # 100ms sleep to not hog the event loop
-
-        thread.join()  # Make sure thread is completely done
-
-        return result_list[0] if result_list else False
-
-    async def _force_join_room(self, user_id: str, room_id: str) -> bool:
-        """
-        Async wrapper to run the synchronous room join function in a thread.
-        """
-        result_list = []
-        thread = threading.Thread(
-            target=self._force_join_room_thread,
-            args=(user_id, room_id, result_list)
-        )
-        thread.start()
-
-        # Await in the event loop for the thread to complete
-        while thread.is_alive():
-            await self.api.sleep(0.1)  # 100ms sleep to not hog the event loop
-
-        thread.join()  # Make sure thread is completely done
-
-        return result_list[0] if result_list else False
+            return False